@@ -6,11 +6,15 @@ import curses
 import random
 from curses import wrapper
 from enum import Enum
-from time import sleep
+from itertools import accumulate
+from time import perf_counter, sleep
 
 # Frames Per Second
 FPS = 30
 
+# how many frames behind we'll let ourselves fall before giving up on catching up
+MAX_FRAME_LAG = 3
+
 # little random bullets cuz why not?
 BULLETS = [
     ".",
@@ -43,12 +47,27 @@ ENEMIES = [
     ";",
 ]
 
-
-class Axis(Enum):
-    """shortcut for the axis"""
-
-    X = 1
-    Y = 2
+# what each key does to you as (dy, dx, shots)
+KEYMAP = {
+    ord("w"): (-1, 0, 0),
+    curses.KEY_UP: (-1, 0, 0),
+    ord("s"): (1, 0, 0),
+    curses.KEY_DOWN: (1, 0, 0),
+    ord("a"): (0, -1, 0),
+    curses.KEY_LEFT: (0, -1, 0),
+    ord("d"): (0, 1, 0),
+    curses.KEY_RIGHT: (0, 1, 0),
+    ord(" "): (0, 0, 1),
+}
+
+# the icons as the bytes that end up in the frame buffer, encoded once up front
+BULLET_ICONS = [bullet.encode("ascii") for bullet in BULLETS]
+ENEMY_ICONS = [enemy.encode("ascii") for enemy in ENEMIES]
+
+# Enemy moves as (dy, dx): stand still 65% of the time, otherwise left 30%, right 20%, up 25%
+# and down 25%
+ENEMY_STEPS = [(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)]
+ENEMY_STEP_ODDS = list(accumulate([0.65, 0.35 * 0.30, 0.35 * 0.20, 0.35 * 0.25, 0.35 * 0.25]))
 
 
 class ColorScheme(int, Enum):
@@ -57,10 +76,93 @@ class ColorScheme(int, Enum):
     PLAYER_REGULAR = 1
     BULLET = 2
     ENEMY_REGULAR = 3
-    INVISIBLE = 4
     SCOREBOARD = 5
 
 
+class FrameBuffer:
+    """Off-screen copy of a frame so only the cells that changed get written to the terminal"""
+
+    def __init__(self, screen, lines, cols):
+        self.screen = screen
+        self.lines = lines
+        self.cols = cols
+        # the color pairs are all set up by now, so look up their attributes once
+        self.color_attrs = [curses.color_pair(i) for i in range(max(ColorScheme) + 1)]
+        # how many cells wide each row is, the bottom right cell can't be written without curses
+        # erroring so the last row is one short
+        self.row_widths = [cols] * (lines - 1) + [cols - 1]
+        # a full row's worth of each color to slice longer text's colors out of
+        self._color_runs = [bytes((i,)) * cols for i in range(max(ColorScheme) + 1)]
+        self._blank_row_chars = b" " * cols
+        self._blank_row_colors = bytes(cols)
+        self.chars = bytearray(self._blank_row_chars * lines)
+        self.colors = bytearray(self._blank_row_colors * lines)
+        # what the terminal is showing right now, as of the last flush
+        self._shown_chars = bytearray(self.chars)
+        self._shown_colors = bytearray(self.colors)
+        # the rows touched this frame and the rows left with something on them last flush,
+        # every other row is blank in both copies and can't have changed
+        self._drawn_rows = set()
+        self._shown_rows = set()
+
+    def draw(self, y, x, text, color_scheme):
+        """put some ascii bytes into the frame, nothing hits the screen until flush"""
+        start = y * self.cols + x
+        if len(text) == 1:
+            # nearly everything on screen is a single character, so skip the slicing for those
+            self.chars[start] = text[0]
+            self.colors[start] = color_scheme
+        else:
+            text = text[: self.cols - x]
+            end = start + len(text)
+            self.chars[start:end] = text
+            self.colors[start:end] = self._color_runs[color_scheme][: len(text)]
+        self._drawn_rows.add(y)
+
+    def clear(self):
+        """blank out the frame to start drawing the next one"""
+        cols = self.cols
+        for y in self._drawn_rows:
+            row_start = y * cols
+            self.chars[row_start : row_start + cols] = self._blank_row_chars
+            self.colors[row_start : row_start + cols] = self._blank_row_colors
+        self._drawn_rows = set()
+
+    def flush(self):
+        """write the changed cells out, merging neighbors of the same color into one addstr"""
+        chars, colors = self.chars, self.colors
+        color_attrs = self.color_attrs
+        shown_chars, shown_colors = self._shown_chars, self._shown_colors
+        for y in self._drawn_rows | self._shown_rows:
+            row_start = y * self.cols
+            row_end = row_start + self.row_widths[y]
+            if (
+                chars[row_start:row_end] == shown_chars[row_start:row_end]
+                and colors[row_start:row_end] == shown_colors[row_start:row_end]
+            ):
+                continue
+            i = row_start
+            while i < row_end:
+                if chars[i] == shown_chars[i] and colors[i] == shown_colors[i]:
+                    i += 1
+                    continue
+                run_start = i
+                color = colors[i]
+                i += 1
+                while (
+                    i < row_end
+                    and colors[i] == color
+                    and (chars[i] != shown_chars[i] or colors[i] != shown_colors[i])
+                ):
+                    i += 1
+                self.screen.addstr(
+                    y, run_start - row_start, bytes(chars[run_start:i]), color_attrs[color]
+                )
+            shown_chars[row_start:row_end] = chars[row_start:row_end]
+            shown_colors[row_start:row_end] = colors[row_start:row_end]
+        self._shown_rows = self._drawn_rows
+
+
 class Coordinate:
     """Abstract class of something that can exist on screen as well as move across it"""
 
@@ -69,91 +171,111 @@ class Coordinate:
         self.y = y
         self.x = x
         self.icon = icon
-        self.color_scheme = color_scheme
-
-    def bind(self, coord, lower_bound, upper_bound):
-        """moves a thing without allowing it to go outside the bounds"""
-        return min(max(coord, lower_bound), upper_bound)
+        self._icon_len = len(icon)
+        self._y_max = screen.lines - 1
+        # a plain int, so drawing doesn't go through the enum machinery every frame
+        self.color_scheme = int(color_scheme)
 
     def bind_x_to_screen(self, x):
         """moves along the x axis preventing from going off screen"""
-        if self.y == curses.LINES - 1:
-            offset = 1
-        else:
-            offset = 0
-        return self.bind(x, 0, curses.COLS - (len(self.icon) + offset))
+        x_max = self.screen.row_widths[self.y] - self._icon_len
+        return 0 if x < 0 else x_max if x > x_max else x
 
     def bind_y_to_screen(self, y):
         """moves along the y axis preventing from going off screen"""
-        return self.bind(y, 0, curses.LINES - 1)
+        y_max = self._y_max
+        return 0 if y < 0 else y_max if y > y_max else y
+
+    def _move_x(self, distance):
+        """move a thing along the x axis"""
+        self.x = self.bind_x_to_screen(self.x + distance)
 
-    def _move(self, axis, distance):
-        """move a thing a direction"""
-        if axis == Axis.X:
-            self.x = self.bind_x_to_screen(self.x + distance)
-        if axis == Axis.Y:
-            self.y = self.bind_y_to_screen(self.y + distance)
+    def _move_y(self, distance):
+        """move a thing along the y axis"""
+        self.y = self.bind_y_to_screen(self.y + distance)
 
     def move_left(self, distance):
         """move it left"""
-        self._move(Axis.X, -1 * distance)
+        self._move_x(-1 * distance)
 
     def move_right(self, distance):
         """move it right"""
-        self._move(Axis.X, distance)
+        self._move_x(distance)
 
     def move_up(self, distance):
         """move it up"""
-        self._move(Axis.Y, -1 * distance)
+        self._move_y(-1 * distance)
 
     def move_down(self, distance):
         """move it down"""
-        self._move(Axis.Y, distance)
+        self._move_y(distance)
 
     def render(self):
         """render the object on screen"""
-        self.screen.addstr(self.y, self.x, self.icon, curses.color_pair(self.color_scheme))
-
-
-class Bullet(Coordinate):
-    """Class for the launch-able projectiles!"""
-
-    def __init__(
-        self,
-        screen,
-        y: int = 0,
-        x: int = 0,
-        fired=False,
-        speed=1,
-        icon=BULLETS[0],
-        color_scheme=ColorScheme.BULLET,
-    ):
-        super().__init__(screen, y, x, icon, color_scheme)
-        self.fired = fired
-        self.speed = speed
+        self.screen.draw(self.y, self.x, self.icon, self.color_scheme)
 
-    def fire(self, player):
-        """initializes the bullet on screen"""
-        self.y = player.y
-        self.x = player.x
-        self.fired = True
-        self.render()
+
+class Magazine:
+    """All of the launch-able projectiles! Kept as parallel lists with a stack of the loaded ones"""
+
+    def __init__(self, screen, size=1, speed=1, color_scheme=ColorScheme.BULLET):
+        self.screen = screen
+        self.speed = speed
+        self.color_scheme = int(color_scheme)
+        self.ys = []
+        self.xs = []
+        self.icons = []
+        # bullets only fly sideways, so the wall they stop at only changes when they're fired
+        self._right_edges = []
+        # which bullets are loaded and ready to go and which ones are out flying
+        self._loaded = []
+        self._flying = set()
+        for _ in range(size):
+            self.add()
+
+    def add(self):
+        """load another bullet in"""
+        self._loaded.append(len(self.ys))
+        self.ys.append(0)
+        self.xs.append(0)
+        self.icons.append(random.choice(BULLET_ICONS))
+        self._right_edges.append(0)
+
+    def fire(self, y, x, count=1):
+        """shoots up to count of the loaded bullets from a spot"""
+        while count and self._loaded:
+            i = self._loaded.pop()
+            self.ys[i] = y
+            self.xs[i] = x
+            self._right_edges[i] = self.screen.row_widths[y] - len(self.icons[i])
+            self._flying.add(i)
+            count -= 1
+
+    def by_cell(self):
+        """the bullets out flying, indexed by the (y, x) cell they're in"""
+        cells = {}
+        for i in self._flying:
+            cells.setdefault((self.ys[i], self.xs[i]), []).append(i)
+        return cells
 
     def keep_shooting(self):
-        """Either moves the bullet forward or stops if it hits the wall"""
-        if self.x >= curses.COLS - len(self.icon) or (
-            self.y == curses.LINES - 1 and self.x >= curses.COLS - (len(self.icon) + 1)
-        ):
-            self.stop()
-        else:
-            self.move_right(self.speed)
-            self.render()
+        """Either moves each bullet forward or stops it if it hits the wall"""
+        for i in list(self._flying):
+            x = self.xs[i]
+            right_edge = self._right_edges[i]
+            if x >= right_edge:
+                self.stop(i)
+            else:
+                x = min(x + self.speed, right_edge)
+                self.xs[i] = x
+                self.screen.draw(self.ys[i], x, self.icons[i], self.color_scheme)
 
-    def stop(self):
-        """stops the bullet and resets its coordinates"""
-        self.fired = False
-        self.x = 0
-        self.y = 0
+    def stop(self, i):
+        """stops a bullet, resets its coordinates and loads it back in"""
+        self.xs[i] = 0
+        self.ys[i] = 0
+        self._flying.discard(i)
+        self._loaded.append(i)
 
 
 class Creature(Coordinate):
@@ -168,93 +290,121 @@ class Creature(Coordinate):
 
 
 class Enemy(Creature):
-    def __init__(self, screen, y=0, x=0, icon=ENEMIES[0]):
+    def __init__(self, screen, y=0, x=0, icon=ENEMY_ICONS[0]):
         super().__init__(
             screen, y, x, icon=icon, color_scheme=ColorScheme.ENEMY_REGULAR, alive=True
         )
 
-    def move_random(self):
-        """Make erratic movements slightly favoring standing still and moving left"""
-        where_to = random.random()
-        if where_to > 0.35:
-            pass
-        else:
-            how_bout_now = random.random()
-            if how_bout_now > 0.5:
-                if how_bout_now > 0.70:
-                    self.move_left(1)
-                else:
-                    self.move_right(1)
-            else:
-                if how_bout_now > 0.25:
-                    self.move_up(1)
-                else:
-                    self.move_down(1)
+    def respawn(self, y, x, icon):
+        """bring a dead enemy back somewhere new instead of making a whole new one"""
+        self.y = y
+        self.x = x
+        self.icon = icon
+        self._icon_len = len(icon)
+        self.alive = True
+
+    def step(self, dy, dx):
+        """take a single step in whichever direction"""
+        if dx:
+            self._move_x(dx)
+        elif dy:
+            self._move_y(dy)
+
+    @staticmethod
+    def random_steps(count):
+        """Pick erratic movements slightly favoring standing still and moving left
+
+        Steps for a whole bunch of enemies get picked in one go rather than rolling dice enemy by
+        enemy
+        """
+        return random.choices(ENEMY_STEPS, cum_weights=ENEMY_STEP_ODDS, k=count)
 
 
 class Player(Creature):
     """This is you"""
 
-    def __init__(self, screen, y=0, x=0, shots=None):
+    def __init__(self, screen, y=0, x=0, shots=None, alive_count=1):
         super().__init__(
-            screen, y, x, icon=" ", color_scheme=ColorScheme.PLAYER_REGULAR, alive=True
+            screen, y, x, icon=b" ", color_scheme=ColorScheme.PLAYER_REGULAR, alive=True
         )
-        self.shots = shots or [Bullet(self.screen, icon=random.choice(BULLETS))]
-
-    def parse_keys(self, key):
-        """Parse key presses for movement and stuff"""
-        if key == ord("w") or key == curses.KEY_UP:
-            self.move_up(1)
-        if key == ord("s") or key == curses.KEY_DOWN:
-            self.move_down(1)
-        if key == ord("a") or key == curses.KEY_LEFT:
-            self.move_left(1)
-        if key == ord("d") or key == curses.KEY_RIGHT:
-            self.move_right(1)
-        if key == ord(" "):
-            self.fire()
+        self.shots = shots if shots is not None else Magazine(self.screen)
+        # running tally of the enemies still standing and the ones you've taken out
+        self.alive_count = alive_count
+        self.dead_count = 0
+        # enemies swept out of the list after dying, waiting to be reused by the next wave
+        self._fallen = []
+
+    def parse_keys_batch(self, keys):
+        """Parse all the key presses since last frame, adding up the movement and shots"""
+        dy = dx = shots = 0
+        for key in keys:
+            action = KEYMAP.get(key)
+            if action is not None:
+                dy += action[0]
+                dx += action[1]
+                shots += action[2]
+        # up and down first since how far right you can go depends on the row you're in
+        if dy:
+            self._move_y(dy)
+        if dx:
+            self._move_x(dx)
+        if shots:
+            self.fire(shots)
 
     def update_background_attributes(self, enemies):
         """Updates your bullets and stuff"""
-        for e in enemies:
+        # index the fired bullets by the cell they sit in so each enemy is a single lookup
+        find_hits = self.shots.by_cell().get
+        player_cell = (self.y, self.x)
+        # one step per enemy in the list, dead or not, so the steps can never run out partway
+        # through; culling keeps the dead to under half the list
+        steps = Enemy.random_steps(len(enemies))
+        # this loop runs for every enemy every frame, so everything it touches is bound to a local
+        # name up front and the tallies only get written back once it's done
+        stop_bullet = self.shots.stop
+        load_bullet = self.shots.add
+        kills = 0
+        for e, (dy, dx) in zip(enemies, steps):
             if e.alive:
-                e.move_random()
+                e.step(dy, dx)
                 e.render()
-                if e.y == self.y and e.x == self.x:
+                enemy_cell = (e.y, e.x)
+                if enemy_cell == player_cell:
                     self.die()
                     break
-                for bullet in self.shots:
-                    if bullet.y == e.y and bullet.x == e.x:
-                        e.die()
-                        bullet.stop()
-                        self.shots.append(Bullet(self.screen, icon=random.choice(BULLETS)))
-                        break
-        if not any([e.alive for e in enemies]):
-            current_enemy_death_toll = len(enemies)
-            for _ in range(current_enemy_death_toll):
-                enemies.append(
-                    Enemy(
-                        self.screen,
-                        random.randint(0, curses.LINES - 1),
-                        random.randint(5, curses.COLS - 2),
-                        icon=random.choice(ENEMIES),
-                    )
-                )
+                hits = find_hits(enemy_cell)
+                if hits:
+                    e.die()
+                    kills += 1
+                    stop_bullet(hits.pop())
+                    load_bullet()
+        self.alive_count -= kills
+        self.dead_count += kills
+        # sweep out the dead once they're the majority so the loop above only walks the living
+        if len(enemies) - self.alive_count > len(enemies) // 2:
+            self._fallen.extend(e for e in enemies if not e.alive)
+            enemies[:] = [e for e in enemies if e.alive]
+        if self.alive_count == 0:
+            current_enemy_death_toll = self.dead_count
+            ys = random.choices(range(0, self.screen.lines), k=current_enemy_death_toll)
+            xs = random.choices(range(5, self.screen.cols - 1), k=current_enemy_death_toll)
+            icons = random.choices(ENEMY_ICONS, k=current_enemy_death_toll)
+            for y, x, icon in zip(ys, xs, icons):
+                if self._fallen:
+                    e = self._fallen.pop()
+                    e.respawn(y, x, icon)
+                else:
+                    e = Enemy(self.screen, y, x, icon=icon)
+                enemies.append(e)
+            self.alive_count += current_enemy_death_toll
 
-        for bullet in self.shots:
-            if bullet.fired:
-                bullet.keep_shooting()
+        self.shots.keep_shooting()
 
         self.render()
 
-    def fire(self):
+    def fire(self, count=1):
         """Shoot any available bullets you have left!"""
-        for bullet in self.shots:
-            if not bullet.fired:
-                bullet.fire(self)
-                break
-        else:
-            pass
+        self.shots.fire(self.y, self.x, count)
 
 
 class Game:
@@ -262,40 +412,66 @@ class Game:
 
     def __init__(self, kills=0):
         self.kills = kills
+        # what the scoreboard last showed, so it only gets redrawn when it changes
+        self._last_kills = None
 
     def main(self, screen):
         """
         Main program
         """
         screen.nodelay(1)
+        # nothing in the game needs a cursor, so hide it if the terminal lets us
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
         screen.clear()
         curses.init_pair(ColorScheme.PLAYER_REGULAR, curses.COLOR_BLACK, curses.COLOR_GREEN)
         curses.init_pair(ColorScheme.ENEMY_REGULAR, curses.COLOR_BLACK, curses.COLOR_RED)
         curses.init_pair(ColorScheme.BULLET, curses.COLOR_RED, curses.COLOR_BLACK)
-        curses.init_pair(ColorScheme.INVISIBLE, curses.COLOR_BLACK, curses.COLOR_BLACK)
         curses.init_pair(ColorScheme.SCOREBOARD, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
-        player = Player(screen, 0, 0)
-        enemies = [
-            Enemy(screen, y=curses.LINES - 1, x=curses.COLS // 2, icon=random.choice(ENEMIES))
-        ]
+        lines, cols = curses.LINES, curses.COLS
+        frame = FrameBuffer(screen, lines, cols)
+        enemies = [Enemy(frame, y=lines - 1, x=cols // 2, icon=random.choice(ENEMY_ICONS))]
+        player = Player(frame, 0, 0, alive_count=len(enemies))
+        # the scoreboard gets its own little window up in the top right, drawn over the game
+        kills_message = f"K: {self.kills:0>6}".encode("ascii")
+        hud = curses.newwin(1, len(kills_message) + 1, 0, cols - len(kills_message) - 1)
+        frame_time = 1 / FPS
+        deadline = perf_counter() + frame_time
         while player.alive:
+            keys = []
             key = screen.getch()
-            player.parse_keys(key)
-            screen.clear()
+            while key != -1:
+                keys.append(key)
+                key = screen.getch()
+            player.parse_keys_batch(keys)
+            frame.clear()
             player.update_background_attributes(enemies)
-            self.kills = len([1 for e in enemies if not e.alive])
-            kills_message = f"K: {self.kills:0>6}"
-            screen.addstr(
-                0,
-                curses.COLS - len(kills_message) - 1,
-                kills_message,
-                curses.color_pair(ColorScheme.SCOREBOARD),
-            )
-            screen.addstr(
-                curses.LINES - 1, curses.COLS - 2, " ", curses.color_pair(ColorScheme.INVISIBLE)
-            )
-            screen.refresh()
-            sleep(1 / FPS)
+            self.kills = player.dead_count
+            if self.kills != self._last_kills:
+                kills_message = f"K: {self.kills:0>6}".encode("ascii")
+                hud.addstr(0, 0, kills_message, frame.color_attrs[ColorScheme.SCOREBOARD])
+                self._last_kills = self.kills
+            frame.flush()
+            # stage both windows and push them to the terminal together, the scoreboard is always
+            # marked as touched so it stays on top of anything the game drew under it
+            screen.noutrefresh()
+            hud.touchwin()
+            hud.noutrefresh()
+            curses.doupdate()
+            self.wait_for(deadline)
+            # don't rush through a bunch of frames to make up for a long hiccup
+            deadline = max(deadline + frame_time, perf_counter() - MAX_FRAME_LAG * frame_time)
+
+    def wait_for(self, deadline):
+        """sleep until the deadline, spinning through the last millisecond since sleep overshoots"""
+        while True:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+            if remaining > 0.002:
+                sleep(remaining - 0.001)
 
     def print_score(self):
         print(f"but got {game.kills} kills")